@@ -1,14 +1,22 @@
 import asyncio
 import argparse
+import itertools
 import os
-import json
-from datetime import datetime
+import orjson
+import time
+from collections import deque
+from datetime import datetime, timezone
 from pathlib import Path
 import logging
-from typing import List, Dict
+from typing import BinaryIO, List, Dict, Optional
 import sys
 
-from wallet_manager import WalletFileManager
+try:
+    import uvloop
+except ImportError:  # uvloop tidak tersedia di Windows
+    uvloop = None
+
+from wallet_manager import WalletFileManager, ensure_dir
 from helios_operations import HeliosOperations
 
 class HeliosMultiBot:
@@ -16,16 +24,26 @@ class HeliosMultiBot:
         self.batch_number = batch_number
         self.total_batches = total_batches
         self.wallet_manager = WalletFileManager()
-        self.helios_ops = HeliosOperations(os.getenv('HELIOS_RPC_URL'))
+        self.helios_ops = HeliosOperations(
+            os.getenv('HELIOS_RPC_URL'),
+            rate_limit=int(os.getenv('HELIOS_RPC_RATE_LIMIT', '10')),
+            rpc_batch_size=int(os.getenv('HELIOS_RPC_BATCH_SIZE', '100'))
+        )
+        self.max_concurrent_wallets = int(os.getenv('HELIOS_MAX_CONCURRENT_WALLETS', '5'))
         self.setup_directories()
         
     def setup_directories(self):
         """Setup direktori untuk logs dan reports"""
         for dir_name in ['logs', 'reports', 'wallets']:
-            Path(dir_name).mkdir(exist_ok=True)
+            ensure_dir(dir_name)
     
-    async def process_wallet_batch(self, wallets: List[Dict]) -> Dict:
-        """Process batch of wallets concurrently"""
+    async def process_wallet_batch(self, wallets: List[Dict], details_file: Optional[BinaryIO] = None) -> Dict:
+        """Process batch of wallets concurrently
+        
+        Detail per wallet ditulis ke details_file (NDJSON) begitu selesai.
+        Aggregate di memory hanya counters dan beberapa tx terakhir; result
+        wallet yang submit tx tetap disimpan sampai receipts selesai.
+        """
         results = {
             'batch_number': self.batch_number,
             'processed': 0,
@@ -34,61 +52,158 @@ class HeliosMultiBot:
             'total_staked': 0.0,
             'total_compounded': 0.0,
             'errors': 0,
-            'transactions': [],
-            'wallet_details': []
+            'skipped': 0,
+            'recent_transactions': deque(maxlen=5)
         }
         
-        # Limit concurrent operations untuk avoid rate limiting
-        semaphore = asyncio.Semaphore(5)
+        # Batasi wallet yang diproses bersamaan; rate limit per RPC request
+        # (HELIOS_RPC_RATE_LIMIT) di-enforce oleh HeliosOperations
+        semaphore = asyncio.Semaphore(self.max_concurrent_wallets)
         
-        async def process_single_wallet(wallet):
+        async def process_single_wallet(wallet, wallet_info):
             async with semaphore:
-                return await self.process_wallet_operations(wallet)
+                return await self.process_wallet_operations(wallet, wallet_info)
         
-        logging.info(f"Processing {len(wallets)} wallets in batch {self.batch_number}")
+        logging.info("Processing %s wallets in batch %s", len(wallets), self.batch_number)
         
-        # Process wallets concurrently
-        tasks = [process_single_wallet(wallet) for wallet in wallets]
-        wallet_results = await asyncio.gather(*tasks, return_exceptions=True)
+        # Preflight: balances untuk semua wallet dalam satu batched RPC request
+        wallet_infos = await self.helios_ops.batch_wallet_info([wallet['address'] for wallet in wallets])
         
-        # Aggregate results
-        for i, result in enumerate(wallet_results):
+        # Wallet tanpa balance/rewards cukup tidak perlu ambil slot concurrency
+        active = []
+        for wallet, wallet_info in zip(wallets, wallet_infos):
+            if 'error' not in wallet_info and self.needs_operations(wallet_info):
+                active.append((wallet, wallet_info))
+                continue
+            
+            result = self.new_wallet_result(wallet, wallet_info)
             results['processed'] += 1
             
-            if isinstance(result, Exception):
+            # Balance 0.0 karena RPC error bukan berarti wallet dormant
+            if 'error' in wallet_info:
+                result['status'] = 'error'
                 results['errors'] += 1
-                logging.error(f"❌ Wallet {wallets[i]['id']} failed: {result}")
+                logging.error("❌ Wallet %s failed: %s", wallet['id'], wallet_info['error'])
+            else:
+                result['final_balance'] = result['initial_balance']
+                result['status'] = 'skipped'
+                results['skipped'] += 1
+            
+            self.aggregate_wallet_result(results, result, details_file)
+        
+        logging.info("⏭️ Skipped %s dormant wallets, %s need operations", results['skipped'], len(active))
+        
+        # Nonces, gas price dan chain ID hanya untuk wallet yang akan kirim tx
+        if active:
+            await self.helios_ops.batch_prepare_txs([wallet['address'] for wallet, _ in active])
+        
+        # Phase 1: submit semua transactions concurrently
+        tasks = []
+        for wallet, wallet_info in active:
+            task = asyncio.create_task(process_single_wallet(wallet, wallet_info))
+            task.wallet_id = wallet['id']
+            tasks.append(task)
+        
+        submitted = []
+        async for task in self.iter_completed(tasks):
+            try:
+                submitted.append(task.result())
+            except Exception as e:
+                results['processed'] += 1
+                self.record_wallet_error(results, task.wallet_id, e, details_file)
+        
+        # Phase 2: tunggu semua receipts dalam satu polling loop
+        tx_hashes = [
+            tx_hash
+            for result in submitted
+            for tx_hash in (result['stake_tx'], result['compound_tx']) if tx_hash
+        ]
+        receipts = await self.helios_ops.await_receipts(tx_hashes) if tx_hashes else {}
+        
+        # Phase 3: final balances dalam satu batched request, lalu finalize
+        # (tx yang gagal tetap memakai gas, jadi semua wallet dengan tx ikut)
+        tx_addresses = [
+            result['address'] for result in submitted
+            if result['stake_tx'] or result['compound_tx']
+        ]
+        final_infos = {}
+        if tx_addresses:
+            infos = await self.helios_ops.batch_wallet_info(tx_addresses)
+            final_infos = {info['address']: info for info in infos}
+        
+        for result in submitted:
+            results['processed'] += 1
+            try:
+                result = self.finalize_wallet_operations(result, receipts, final_infos)
+            except Exception as e:
+                self.record_wallet_error(results, result['wallet_id'], e, details_file)
                 continue
-                
-            if result:
-                results['wallet_details'].append(result)
-                
-                if result.get('stake_tx'):
-                    results['successful_stakes'] += 1
-                    results['total_staked'] += result.get('stake_amount', 0)
-                    
-                if result.get('compound_tx'):
-                    results['successful_compounds'] += 1
-                    results['total_compounded'] += result.get('compound_amount', 0)
-                    
-                if result.get('stake_tx') or result.get('compound_tx'):
-                    results['transactions'].append({
-                        'wallet_id': result['wallet_id'],
-                        'stake_tx': result.get('stake_tx'),
-                        'compound_tx': result.get('compound_tx'),
-                        'stake_amount': result.get('stake_amount', 0),
-                        'compound_amount': result.get('compound_amount', 0)
-                    })
+            
+            self.aggregate_wallet_result(results, result, details_file)
         
         return results
     
-    async def process_wallet_operations(self, wallet: Dict) -> Dict:
-        """Process operations untuk single wallet"""
+    @staticmethod
+    async def iter_completed(tasks: List[asyncio.Task]):
+        """Yield tasks sesuai urutan selesai
+        
+        asyncio.as_completed() yield coroutine baru, bukan task aslinya,
+        jadi atribut seperti wallet_id tidak bisa diakses dari sana.
+        """
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield task
+    
+    def record_wallet_error(self, results: Dict, wallet_id: str, error: Exception, details_file: Optional[BinaryIO] = None):
+        """Catat wallet yang gagal, termasuk di NDJSON supaya tidak hilang dari detail"""
+        results['errors'] += 1
+        logging.error("❌ Wallet %s failed: %s", wallet_id, error)
+        
+        if details_file is not None:
+            record = {'wallet_id': wallet_id, 'status': 'error', 'error': str(error)}
+            details_file.write(orjson.dumps(record) + b"\n")
+    
+    def aggregate_wallet_result(self, results: Dict, result: Dict, details_file: Optional[BinaryIO] = None):
+        """Tambahkan hasil single wallet ke aggregate batch"""
+        if not result:
+            return
+        
+        if details_file is not None:
+            details_file.write(orjson.dumps(result) + b"\n")
+        
+        if result.get('stake_tx'):
+            results['successful_stakes'] += 1
+            results['total_staked'] += result.get('stake_amount', 0)
+            
+        if result.get('compound_tx'):
+            results['successful_compounds'] += 1
+            results['total_compounded'] += result.get('compound_amount', 0)
+            
+        if result.get('stake_tx') or result.get('compound_tx'):
+            results['recent_transactions'].append({
+                'wallet_id': result['wallet_id'],
+                'stake_tx': result.get('stake_tx'),
+                'compound_tx': result.get('compound_tx'),
+                'stake_amount': result.get('stake_amount', 0),
+                'compound_amount': result.get('compound_amount', 0)
+            })
+    
+    @staticmethod
+    def needs_operations(wallet_info: Dict) -> bool:
+        """Wallet perlu stake (balance > 1 HLS) atau compound (rewards > 0.1 HLS)"""
+        return wallet_info['balance'] > 1.0 or wallet_info.get('pending_rewards', 0) > 0.1
+    
+    @staticmethod
+    def new_wallet_result(wallet: Dict, wallet_info: Dict) -> Dict:
+        """Initial result dict untuk single wallet"""
         result = {
             'wallet_id': wallet['id'],
             'address': wallet['address'],
             'filename': wallet['filename'],
-            'initial_balance': 0.0,
+            'initial_balance': wallet_info['balance'],
+            'pending_rewards': wallet_info.get('pending_rewards', 0.0),
             'final_balance': 0.0,
             'stake_tx': None,
             'compound_tx': None,
@@ -96,48 +211,76 @@ class HeliosMultiBot:
             'compound_amount': 0.0,
             'status': 'pending'
         }
+        if 'error' in wallet_info:
+            result['error'] = wallet_info['error']
+        return result
+    
+    async def process_wallet_operations(self, wallet: Dict, wallet_info: Dict) -> Dict:
+        """Submit operations untuk single wallet, receipts ditunggu per batch"""
+        result = self.new_wallet_result(wallet, wallet_info)
         
         try:
-            logging.info(f"🔄 Processing wallet {wallet['id']} ({wallet['address'][:10]}...)")
-            
-            # Get wallet info
-            wallet_info = await self.helios_ops.get_wallet_info(wallet['address'])
-            result['initial_balance'] = wallet_info['balance']
-            result['pending_rewards'] = wallet_info.get('pending_rewards', 0.0)
+            logging.info("🔄 Processing wallet %s (%s...)", wallet['id'], wallet['address'][:10])
             
             # Auto stake jika balance > 1 HLS
             if wallet_info['balance'] > 1.0:
                 stake_amount = wallet_info['balance'] * 0.8  # Stake 80% of balance
-                logging.info(f"💰 Staking {stake_amount:.4f} HLS from {wallet['id']}")
+                logging.info("💰 Staking %.4f HLS from %s", stake_amount, wallet['id'])
                 
-                stake_tx = await self.helios_ops.execute_stake_operation(wallet, stake_amount)
+                stake_tx = await self.helios_ops.submit_stake_operation(wallet, stake_amount)
                 
                 if stake_tx:
                     result['stake_tx'] = stake_tx
                     result['stake_amount'] = stake_amount
-                    
-                # Small delay after staking
-                await asyncio.sleep(2)
             
             # Auto compound rewards jika ada
             if wallet_info.get('pending_rewards', 0) > 0.1:
-                logging.info(f"🔄 Compounding rewards for {wallet['id']}")
-                compound_tx = await self.helios_ops.execute_auto_compound(wallet)
+                logging.info("🔄 Compounding rewards for %s", wallet['id'])
+                compound_tx = await self.helios_ops.submit_auto_compound(wallet)
                 
                 if compound_tx:
                     result['compound_tx'] = compound_tx
                     result['compound_amount'] = wallet_info['pending_rewards']
             
-            # Get final balance
-            final_info = await self.helios_ops.get_wallet_info(wallet['address'])
-            result['final_balance'] = final_info['balance']
-            result['status'] = 'completed'
+            result['status'] = 'submitted'
             
-            # Small delay between wallets
-            await asyncio.sleep(1)
+        except Exception as e:
+            logging.error("❌ Error processing wallet %s: %s", wallet['id'], e)
+            result['status'] = 'error'
+            result['error'] = str(e)
+            raise
+        
+        return result
+    
+    def finalize_wallet_operations(self, result: Dict, receipts: Dict, final_infos: Dict) -> Dict:
+        """Evaluate receipts dan set final balance untuk single wallet"""
+        try:
+            if result['stake_tx']:
+                if receipts.get(result['stake_tx']) == 1:
+                    logging.info("✅ Staked %.4f HLS from %s - TX: %s", result['stake_amount'], result['wallet_id'], result['stake_tx'])
+                else:
+                    logging.error("❌ Stake transaction failed for %s - TX: %s", result['wallet_id'], result['stake_tx'])
+                    result['stake_tx'] = None
+                    result['stake_amount'] = 0.0
+            
+            if result['compound_tx']:
+                if receipts.get(result['compound_tx']) == 1:
+                    logging.info("✅ Compounded %.4f HLS for %s - TX: %s", result['compound_amount'], result['wallet_id'], result['compound_tx'])
+                else:
+                    logging.error("❌ Compound failed for %s - TX: %s", result['wallet_id'], result['compound_tx'])
+                    result['compound_tx'] = None
+                    result['compound_amount'] = 0.0
+            
+            # Final balance dari batch, tanpa tx balance tidak berubah
+            final_info = final_infos.get(result['address'])
+            if final_info is not None:
+                result['final_balance'] = final_info['balance']
+            else:
+                result['final_balance'] = result['initial_balance']
+            result['status'] = 'completed'
             
         except Exception as e:
-            logging.error(f"❌ Error processing wallet {wallet['id']}: {e}")
+            logging.error("❌ Error finalizing wallet %s: %s", result['wallet_id'], e)
             result['status'] = 'error'
             result['error'] = str(e)
             raise
@@ -147,9 +290,7 @@ class HeliosMultiBot:
     def get_batch_wallets(self, all_wallets: Dict) -> List[Dict]:
         """Get wallets untuk batch tertentu"""
         # Flatten all wallets
-        flat_wallets = []
-        for filename, wallets in all_wallets.items():
-            flat_wallets.extend(wallets)
+        flat_wallets = list(itertools.chain.from_iterable(all_wallets.values()))
         
         # Calculate batch size
         total_wallets = len(flat_wallets)
@@ -164,16 +305,19 @@ class HeliosMultiBot:
         
         batch_wallets = flat_wallets[start_idx:end_idx]
         
-        logging.info(f"📊 Batch {self.batch_number}: Processing wallets {start_idx+1}-{end_idx} of {total_wallets}")
+        logging.info("📊 Batch %s: Processing wallets %s-%s of %s", self.batch_number, start_idx+1, end_idx, total_wallets)
         return batch_wallets
     
     async def run_batch(self):
         """Run bot untuk batch tertentu"""
         try:
-            logging.info(f"🚀 Starting Helios Multi-Wallet Bot - Batch {self.batch_number}")
+            logging.info("🚀 Starting Helios Multi-Wallet Bot - Batch %s", self.batch_number)
             
-            # Load all wallets
-            all_wallets = self.wallet_manager.load_all_wallet_files()
+            # Load all wallets sambil setup koneksi RPC
+            all_wallets, _ = await asyncio.gather(
+                asyncio.to_thread(self.wallet_manager.load_all_wallet_files),
+                self.helios_ops._ensure_ready()
+            )
             
             if not all_wallets:
                 logging.error("❌ No wallet files found! Please add .txt files to wallets/ directory")
@@ -185,31 +329,41 @@ class HeliosMultiBot:
             batch_wallets = self.get_batch_wallets(all_wallets)
             
             if not batch_wallets:
-                logging.info(f"ℹ️ No wallets to process in batch {self.batch_number}")
+                logging.info("ℹ️ No wallets to process in batch %s", self.batch_number)
                 return
             
-            logging.info(f"🔥 Starting batch {self.batch_number} with {len(batch_wallets)} wallets")
+            logging.info("🔥 Starting batch %s with %s wallets", self.batch_number, len(batch_wallets))
             
             # Process batch
-            start_time = datetime.now()
-            results = await self.process_wallet_batch(batch_wallets)
-            end_time = datetime.now()
+            # Durasi pakai monotonic clock, wall clock hanya untuk display
+            start_ns = time.monotonic_ns()
+            start_time = datetime.now(timezone.utc)
+            timestamp = start_time.strftime('%Y%m%d_%H%M%S')
             
-            results['execution_time'] = str(end_time - start_time)
+            # Detail per wallet di-stream ke NDJSON selama batch berjalan
+            details_file = f"reports/batch_{self.batch_number}_{timestamp}.ndjson"
+            with open(details_file, 'ab') as f:
+                results = await self.process_wallet_batch(batch_wallets, f)
+            elapsed_s = (time.monotonic_ns() - start_ns) / 1e9
+            
+            results['execution_time'] = f"{elapsed_s:.3f}s"
             results['start_time'] = start_time.isoformat()
-            results['end_time'] = end_time.isoformat()
+            results['end_time'] = datetime.now(timezone.utc).isoformat()
+            results['details_file'] = details_file
             
             # Generate report
-            await self.generate_batch_report(results)
+            await self.generate_batch_report(results, timestamp)
             
             # Print summary
             self.print_batch_summary(results)
             
-            logging.info(f"✅ Batch {self.batch_number} completed successfully")
+            logging.info("✅ Batch %s completed successfully", self.batch_number)
             
         except Exception as e:
-            logging.error(f"❌ Batch {self.batch_number} failed: {e}")
+            logging.error("❌ Batch %s failed: %s", self.batch_number, e)
             raise
+        finally:
+            await self.helios_ops.close()
     
     def print_batch_summary(self, results: Dict):
         """Print summary ke console untuk GitHub Actions"""
@@ -221,25 +375,27 @@ class HeliosMultiBot:
         print(f"🔄 Successful Compounds: {results['successful_compounds']}")
         print(f"💰 Total Staked: {results['total_staked']:.4f} HLS")
         print(f"🎁 Total Compounded: {results['total_compounded']:.4f} HLS")
+        print(f"⏭️ Skipped (dormant): {results['skipped']}")
         print(f"❌ Errors: {results['errors']}")
         print(f"⏱️ Execution Time: {results.get('execution_time', 'N/A')}")
         
-        if results['transactions']:
+        if results['recent_transactions']:
             print(f"\n📝 Recent Transactions:")
-            for tx in results['transactions'][-5:]:  # Show last 5 transactions
+            for tx in results['recent_transactions']:  # Last 5 transactions
                 print(f"  • {tx['wallet_id']}: Stake={tx.get('stake_amount', 0):.4f} HLS")
                 
         print("="*60 + "\n")
     
-    async def generate_batch_report(self, results: Dict):
-        """Generate laporan untuk batch"""
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    async def generate_batch_report(self, results: Dict, timestamp: Optional[str] = None):
+        """Generate laporan summary untuk batch (detail per wallet ada di NDJSON)"""
+        now = datetime.now(timezone.utc)
+        timestamp = timestamp or now.strftime('%Y%m%d_%H%M%S')
         report_file = f"reports/batch_{self.batch_number}_{timestamp}.json"
         latest_file = f"reports/batch_{self.batch_number}_latest.json"
         
         report_data = {
             'batch_number': self.batch_number,
-            'timestamp': datetime.now().isoformat(),
+            'timestamp': now.isoformat(),
             'summary': {
                 'wallets_processed': results['processed'],
                 'successful_stakes': results['successful_stakes'],
@@ -247,21 +403,25 @@ class HeliosMultiBot:
                 'total_staked_hls': results['total_staked'],
                 'total_compounded_hls': results['total_compounded'],
                 'errors': results['errors'],
+                'wallets_skipped': results['skipped'],
                 'execution_time': results.get('execution_time')
             },
-            'transactions': results['transactions'],
-            'wallet_details': results['wallet_details']
+            'details_file': results.get('details_file')
         }
         
-        # Save timestamped report
-        with open(report_file, 'w') as f:
-            json.dump(report_data, f, indent=2)
+        # Save timestamped report (serialize sekali)
+        blob = orjson.dumps(report_data, option=orjson.OPT_INDENT_2)
+        Path(report_file).write_bytes(blob)
         
-        # Save latest report (untuk GitHub Actions display)
-        with open(latest_file, 'w') as f:
-            json.dump(report_data, f, indent=2)
+        # Save latest report (untuk GitHub Actions display) sebagai hard link
+        latest_path = Path(latest_file)
+        latest_path.unlink(missing_ok=True)
+        try:
+            os.link(report_file, latest_file)
+        except OSError:
+            latest_path.write_bytes(blob)
         
-        logging.info(f"📄 Report saved: {report_file}")
+        logging.info("📄 Report saved: %s", report_file)
 
 async def main():
     parser = argparse.ArgumentParser(description='Helios Multi-Wallet Bot')
@@ -280,4 +440,6 @@ async def main():
     await bot.run_batch()
 
 if __name__ == "__main__":
+    if uvloop is not None:
+        uvloop.install()
     asyncio.run(main())
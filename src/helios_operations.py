@@ -1,19 +1,40 @@
 import asyncio
 import aiohttp
-from web3 import Web3
-from web3.middleware import geth_poa_middleware
+import itertools
+from web3 import AsyncWeb3, AsyncHTTPProvider, Web3
+from web3.middleware import async_geth_poa_middleware
 from eth_account import Account
 import json
 import time
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 import logging
+from asyncio_throttle import Throttler
 from tenacity import retry, stop_after_attempt, wait_exponential
 
+class RPCBatchError(Exception):
+    """Provider menolak batched JSON-RPC request"""
+    pass
+
 class HeliosOperations:
-    def __init__(self, rpc_url: str = None):
+    def __init__(self, rpc_url: str = None, rate_limit: int = 10, rpc_batch_size: int = 100):
         self.rpc_url = rpc_url or "https://testnet1.helioschainlabs.org"
-        self.w3 = Web3(Web3.HTTPProvider(self.rpc_url))
-        self.w3.middleware_onion.inject(geth_poa_middleware, layer=0)
+        
+        # Maksimum calls per batched POST; di-set False jika provider menolak batch
+        self.rpc_batch_size = max(1, rpc_batch_size)
+        self._batch_supported = True
+        
+        # Token bucket per HTTP request ke RPC provider (req/s)
+        self._throttler = Throttler(rate_limit=rate_limit, period=1.0)
+        
+        # Web3 provider dan session dibuat lazily di _ensure_ready
+        self.w3: Optional[AsyncWeb3] = None
+        self.session: Optional[aiohttp.ClientSession] = None
+        self._ready_lock = asyncio.Lock()
+        
+        # Diisi oleh batch_prepare_txs sebelum fan-out per wallet
+        self._nonces: Dict[str, int] = {}
+        self._chain_id: Optional[int] = None
+        self._gas_price_cache = (0.0, 0)  # (timestamp, gas price wei)
         
         # Helios contract addresses (update dengan address yang benar)
         self.contracts = {
@@ -23,40 +44,247 @@ class HeliosOperations:
         }
         
         self.logger = logging.getLogger(__name__)
+    
+    async def _ensure_ready(self):
+        """Setup web3 provider dan test connection ke Helios network (sekali saja)"""
+        if self.w3 is not None:
+            return
+        
+        async with self._ready_lock:
+            if self.w3 is not None:
+                return
+            
+            # Satu shared session (keep-alive) untuk semua RPC calls, termasuk provider web3
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=32,
+                    limit_per_host=32,
+                    ttl_dns_cache=300,
+                    keepalive_timeout=75
+                )
+            )
+            
+            w3 = AsyncWeb3(AsyncHTTPProvider(self.rpc_url))
+            w3.middleware_onion.inject(async_geth_poa_middleware, layer=0)
+            await w3.provider.cache_async_session(self.session)
+            self.w3 = w3
+            
+            try:
+                chain_id = await self._get_chain_id()
+                self.logger.info("Connected to Helios network, Chain ID: %s", chain_id)
+            except Exception as e:
+                self.logger.error("Failed to connect to Helios network: %s", e)
+    
+    async def close(self):
+        """Close shared HTTP session"""
+        if self.session is not None:
+            await self.session.close()
+    
+    async def _rpc_batch(self, calls: List[Tuple[str, list]]) -> List:
+        """Kirim JSON-RPC calls sebagai batched requests
+        
+        Calls dipecah per rpc_batch_size (batas item per batch di provider)
+        dan slices dikirim concurrently. Result None untuk call yang gagal.
+        """
+        await self._ensure_ready()
+        size = self.rpc_batch_size
+        slices = [calls[i:i + size] for i in range(0, len(calls), size)]
+        results = await asyncio.gather(*(self._rpc_slice(calls_slice) for calls_slice in slices))
+        return list(itertools.chain.from_iterable(results))
+    
+    async def _rpc_slice(self, calls: List[Tuple[str, list]]) -> List:
+        """Satu batch POST, fallback ke individual requests jika batch ditolak"""
+        if self._batch_supported:
+            try:
+                return await self._post_rpc_batch(calls)
+            except RPCBatchError as e:
+                self.logger.warning("%s - falling back to individual RPC requests", e)
+                self._batch_supported = False
+            except Exception as e:
+                self.logger.error("RPC batch of %s calls failed: %s", len(calls), e)
+                return [None] * len(calls)
+        
+        return await asyncio.gather(*(self._rpc_single(method, params) for method, params in calls))
+    
+    async def _rpc_single(self, method: str, params: list):
+        """Kirim satu JSON-RPC call (untuk provider tanpa batch support)"""
+        try:
+            reply = await self._post_rpc({'jsonrpc': '2.0', 'id': 0, 'method': method, 'params': params})
+        except Exception as e:
+            self.logger.error("RPC %s failed: %s", method, e)
+            return None
+        
+        if not isinstance(reply, dict) or 'error' in reply:
+            error = reply.get('error') if isinstance(reply, dict) else reply
+            self.logger.error("RPC %s failed: %s", method, error)
+            return None
+        return reply.get('result')
+    
+    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
+    async def _post_rpc(self, payload):
+        """POST JSON-RPC payload di bawah rate limit provider"""
+        async with self._throttler:
+            async with self.session.post(self.rpc_url, json=payload) as response:
+                response.raise_for_status()
+                return await response.json()
+    
+    async def _post_rpc_batch(self, calls: List[Tuple[str, list]]) -> List:
+        """Kirim beberapa JSON-RPC calls dalam satu HTTP request"""
+        payload = [
+            {'jsonrpc': '2.0', 'id': i, 'method': method, 'params': params}
+            for i, (method, params) in enumerate(calls)
+        ]
+        replies = await self._post_rpc(payload)
+        
+        # Provider yang tidak support batch membalas dengan satu error object
+        if not isinstance(replies, list):
+            error = replies.get('error', replies) if isinstance(replies, dict) else replies
+            raise RPCBatchError(f"Batch request rejected by RPC provider: {error}")
+        
+        # Response array tidak dijamin urut, map kembali berdasarkan id
+        results = [None] * len(calls)
+        for reply in replies:
+            reply_id = reply.get('id') if isinstance(reply, dict) else None
+            if not isinstance(reply_id, int) or not 0 <= reply_id < len(calls):
+                self.logger.warning("Ignoring RPC reply without usable id: %s", reply)
+                continue
+            if 'error' in reply:
+                method = calls[reply_id][0]
+                self.logger.error("RPC %s failed: %s", method, reply['error'])
+                continue
+            results[reply_id] = reply.get('result')
+        return results
+    
+    async def batch_wallet_info(self, addresses: List[str]) -> List[Dict]:
+        """Get wallet information untuk banyak address dalam satu batched request"""
+        error = 'eth_getBalance failed'
+        try:
+            balances = await self._rpc_batch(
+                [('eth_getBalance', [address, 'latest']) for address in addresses]
+            )
+            rewards = await asyncio.gather(*(self.get_pending_rewards(a) for a in addresses))
+        except Exception as e:
+            self.logger.error("Error getting batch wallet info: %s", e)
+            balances = [None] * len(addresses)
+            rewards = [0.0] * len(addresses)
+            error = str(e)
+        
+        infos = []
+        for address, balance_hex, pending_rewards in zip(addresses, balances, rewards):
+            if balance_hex is None:
+                infos.append({
+                    'address': address,
+                    'balance': 0.0,
+                    'pending_rewards': 0.0,
+                    'total_value': 0.0,
+                    'error': error
+                })
+                continue
+            
+            balance = float(Web3.from_wei(int(balance_hex, 16), 'ether'))
+            infos.append({
+                'address': address,
+                'balance': balance,
+                'pending_rewards': pending_rewards,
+                'total_value': balance + pending_rewards
+            })
+        return infos
+    
+    async def batch_prepare_txs(self, addresses: List[str]) -> Dict:
+        """Fetch nonces, gas price dan chain ID untuk semua wallet dalam satu round trip"""
+        calls = [('eth_chainId', []), ('eth_gasPrice', [])]
+        calls += [('eth_getTransactionCount', [address, 'pending']) for address in addresses]
         
-        # Test connection
         try:
-            chain_id = self.w3.eth.chain_id
-            self.logger.info(f"Connected to Helios network, Chain ID: {chain_id}")
+            results = await self._rpc_batch(calls)
         except Exception as e:
-            self.logger.error(f"Failed to connect to Helios network: {e}")
+            self.logger.error("Error preparing transactions: %s", e)
+            return {}
+        
+        chain_id_hex, gas_price_hex, nonce_hexes = results[0], results[1], results[2:]
+        if chain_id_hex is not None:
+            self._chain_id = int(chain_id_hex, 16)
+        if gas_price_hex is not None:
+            self._gas_price_cache = (time.monotonic(), int(gas_price_hex, 16))
+        for address, nonce_hex in zip(addresses, nonce_hexes):
+            if nonce_hex is not None:
+                self._nonces[address] = int(nonce_hex, 16)
+        
+        return {
+            'chain_id': self._chain_id,
+            'gas_price': self._gas_price_cache[1],
+            'nonces': dict(self._nonces)
+        }
+    
+    async def _throttled(self, request):
+        """Await satu web3 RPC call di bawah rate limit provider"""
+        async with self._throttler:
+            return await request
+    
+    def _get_account(self, wallet: Dict):
+        """LocalAccount di-derive sekali per wallet lalu disimpan di wallet dict"""
+        account = wallet.get('account')
+        if account is None:
+            account = wallet['account'] = Account.from_key(wallet['private_key'])
+        return account
+    
+    async def _sign_transaction(self, wallet: Dict, tx: Dict):
+        """Derive account (jika belum) dan sign di worker thread, tidak memblok event loop"""
+        return await asyncio.to_thread(
+            lambda: self._get_account(wallet).sign_transaction(tx)
+        )
+    
+    async def _get_chain_id(self) -> int:
+        """Chain ID tidak berubah, cukup fetch sekali"""
+        if self._chain_id is None:
+            await self._ensure_ready()
+            self._chain_id = await self._throttled(self.w3.eth.chain_id)
+        return self._chain_id
+    
+    async def _get_gas_price(self, ttl: float = 2.0) -> int:
+        """Gas price di-cache selama ttl detik (~1 block di Helios)"""
+        timestamp, gas_price = self._gas_price_cache
+        if time.monotonic() - timestamp < ttl:
+            return gas_price
+        await self._ensure_ready()
+        gas_price = await self._throttled(self.w3.eth.gas_price)
+        self._gas_price_cache = (time.monotonic(), gas_price)
+        return gas_price
+    
+    async def _get_nonce(self, address: str) -> int:
+        """Ambil nonce berikutnya dan increment secara lokal"""
+        nonce = self._nonces.get(address)
+        if nonce is None:
+            await self._ensure_ready()
+            nonce = await self._throttled(self.w3.eth.get_transaction_count(address, 'pending'))
+        self._nonces[address] = nonce + 1
+        return nonce
         
     @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
     async def get_wallet_balance(self, address: str) -> float:
         """Get wallet balance dengan retry mechanism"""
         try:
-            balance_wei = self.w3.eth.get_balance(address)
-            balance_eth = self.w3.from_wei(balance_wei, 'ether')
+            await self._ensure_ready()
+            balance_wei = await self._throttled(self.w3.eth.get_balance(address))
+            balance_eth = Web3.from_wei(balance_wei, 'ether')
             return float(balance_eth)
         except Exception as e:
-            self.logger.error(f"Error getting balance for {address}: {e}")
+            self.logger.error("Error getting balance for %s: %s", address, e)
             raise
     
     @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
-    async def execute_stake_operation(self, wallet: Dict, stake_amount: float) -> Optional[str]:
-        """Execute staking operation"""
+    async def submit_stake_operation(self, wallet: Dict, stake_amount: float) -> Optional[str]:
+        """Submit staking transaction, return tx hash tanpa menunggu receipt"""
         try:
-            account = Account.from_key(wallet['private_key'])
-            stake_amount_wei = self.w3.to_wei(stake_amount, 'ether')
+            stake_amount_wei = Web3.to_wei(stake_amount, 'ether')
             
             # Build staking transaction
-            nonce = self.w3.eth.get_transaction_count(account.address)
-            gas_price = self.w3.eth.gas_price
+            gas_price = await self._get_gas_price()
             
             # Limit gas price untuk efisiensi
-            max_gas_price = self.w3.to_wei('25', 'gwei')
+            max_gas_price = Web3.to_wei('25', 'gwei')
             if gas_price > max_gas_price:
-                self.logger.warning(f"Gas price too high: {self.w3.from_wei(gas_price, 'gwei')} gwei")
+                self.logger.warning("Gas price too high: %s gwei", Web3.from_wei(gas_price, 'gwei'))
                 return None
             
             # Simple transfer to staking contract (adjust sesuai dengan staking method)
@@ -65,103 +293,162 @@ class HeliosOperations:
                 'value': stake_amount_wei,
                 'gas': 150000,
                 'gasPrice': min(gas_price, max_gas_price),
-                'nonce': nonce,
-                'chainId': self.w3.eth.chain_id
+                'nonce': await self._get_nonce(wallet['address']),
+                'chainId': await self._get_chain_id()
             }
             
-            # Sign and send transaction
-            signed_tx = self.w3.eth.account.sign_transaction(stake_tx, wallet['private_key'])
-            tx_hash = self.w3.eth.send_raw_transaction(signed_tx.rawTransaction)
-            
-            # Wait for transaction confirmation
-            receipt = self.w3.eth.wait_for_transaction_receipt(tx_hash, timeout=120)
+            # Sign di worker thread supaya tidak memblok event loop, lalu send
+            signed_tx = await self._sign_transaction(wallet, stake_tx)
+            tx_hash = await self._throttled(self.w3.eth.send_raw_transaction(signed_tx.rawTransaction))
             
-            if receipt.status == 1:
-                self.logger.info(f"✅ Staked {stake_amount} HLS from {wallet['id']} - TX: {tx_hash.hex()}")
-                return tx_hash.hex()
-            else:
-                self.logger.error(f"❌ Stake transaction failed for {wallet['id']} - TX: {tx_hash.hex()}")
-                return None
+            self.logger.info("📤 Stake submitted for %s - TX: %s", wallet['id'], tx_hash.hex())
+            return tx_hash.hex()
             
         except Exception as e:
-            self.logger.error(f"Stake error for {wallet['id']}: {e}")
+            self.logger.error("Stake error for %s: %s", wallet['id'], e)
+            # Nonce lokal mungkin sudah tidak valid, fetch ulang untuk tx berikutnya
+            self._nonces.pop(wallet['address'], None)
             return None
     
-    async def execute_auto_compound(self, wallet: Dict) -> Optional[str]:
-        """Execute auto compound rewards"""
+    async def submit_auto_compound(self, wallet: Dict) -> Optional[str]:
+        """Submit compound transaction, return tx hash tanpa menunggu receipt"""
         try:
             # Check pending rewards
             pending_rewards = await self.get_pending_rewards(wallet['address'])
             
             if pending_rewards > 0.1:  # Minimum 0.1 HLS untuk compound
-                account = Account.from_key(wallet['private_key'])
-                
                 # Build compound transaction (adjust sesuai dengan compound method)
                 compound_tx = {
                     'to': self.contracts['rewards'],
                     'value': 0,
                     'gas': 100000,
-                    'gasPrice': self.w3.eth.gas_price,
-                    'nonce': self.w3.eth.get_transaction_count(account.address),
-                    'chainId': self.w3.eth.chain_id,
+                    'gasPrice': await self._get_gas_price(),
+                    'nonce': await self._get_nonce(wallet['address']),
+                    'chainId': await self._get_chain_id(),
                     'data': '0x'  # Add compound function call data here
                 }
                 
-                signed_tx = self.w3.eth.account.sign_transaction(compound_tx, wallet['private_key'])
-                tx_hash = self.w3.eth.send_raw_transaction(signed_tx.rawTransaction)
-                
-                receipt = self.w3.eth.wait_for_transaction_receipt(tx_hash, timeout=120)
+                signed_tx = await self._sign_transaction(wallet, compound_tx)
+                tx_hash = await self._throttled(self.w3.eth.send_raw_transaction(signed_tx.rawTransaction))
                 
-                if receipt.status == 1:
-                    self.logger.info(f"✅ Compounded {pending_rewards} HLS for {wallet['id']} - TX: {tx_hash.hex()}")
-                    return tx_hash.hex()
-                else:
-                    self.logger.error(f"❌ Compound failed for {wallet['id']} - TX: {tx_hash.hex()}")
-                    return None
+                self.logger.info("📤 Compound submitted for %s - TX: %s", wallet['id'], tx_hash.hex())
+                return tx_hash.hex()
                 
         except Exception as e:
-            self.logger.error(f"Compound error for {wallet['id']}: {e}")
+            self.logger.error("Compound error for %s: %s", wallet['id'], e)
+            # Nonce lokal mungkin sudah tidak valid, fetch ulang untuk tx berikutnya
+            self._nonces.pop(wallet['address'], None)
             return None
     
-    async def get_pending_rewards(self, address: str) -> float:
-        """Get pending staking rewards"""
-        try:
-            # Placeholder - implement sesuai dengan Helios staking contract
-            # Contoh: call contract method untuk get pending rewards
-            return 0.0
-        except Exception as e:
-            self.logger.error(f"Error getting rewards for {address}: {e}")
-            return 0.0
-    
-    async def execute_bridge_operation(self, wallet: Dict, amount: float, target_chain: str) -> Optional[str]:
-        """Execute bridge operation ke chain lain"""
+    async def submit_bridge_operation(self, wallet: Dict, amount: float, target_chain: str) -> Optional[str]:
+        """Submit bridge transaction, return tx hash tanpa menunggu receipt"""
         try:
-            account = Account.from_key(wallet['private_key'])
-            
             bridge_tx = {
                 'to': self.contracts['bridge'],
-                'value': self.w3.to_wei(amount, 'ether'),
+                'value': Web3.to_wei(amount, 'ether'),
                 'gas': 200000,
-                'gasPrice': self.w3.eth.gas_price,
-                'nonce': self.w3.eth.get_transaction_count(account.address),
-                'chainId': self.w3.eth.chain_id,
+                'gasPrice': await self._get_gas_price(),
+                'nonce': await self._get_nonce(wallet['address']),
+                'chainId': await self._get_chain_id(),
                 'data': '0x'  # Add bridge function call data here
             }
             
-            signed_tx = self.w3.eth.account.sign_transaction(bridge_tx, wallet['private_key'])
-            tx_hash = self.w3.eth.send_raw_transaction(signed_tx.rawTransaction)
+            signed_tx = await self._sign_transaction(wallet, bridge_tx)
+            tx_hash = await self._throttled(self.w3.eth.send_raw_transaction(signed_tx.rawTransaction))
             
-            receipt = self.w3.eth.wait_for_transaction_receipt(tx_hash, timeout=120)
+            self.logger.info("📤 Bridge to %s submitted for %s - TX: %s", target_chain, wallet['id'], tx_hash.hex())
+            return tx_hash.hex()
             
-            if receipt.status == 1:
-                self.logger.info(f"✅ Bridged {amount} HLS from {wallet['id']} to {target_chain} - TX: {tx_hash.hex()}")
-                return tx_hash.hex()
-            else:
-                self.logger.error(f"❌ Bridge failed for {wallet['id']} - TX: {tx_hash.hex()}")
-                return None
+        except Exception as e:
+            self.logger.error("Bridge error for %s: %s", wallet['id'], e)
+            # Nonce lokal mungkin sudah tidak valid, fetch ulang untuk tx berikutnya
+            self._nonces.pop(wallet['address'], None)
+            return None
+    
+    async def await_receipts(self, tx_hashes: List[str], timeout: float = 120, interval: float = 1.0) -> Dict[str, Optional[int]]:
+        """Poll receipts untuk semua tx hashes dalam satu batched loop
+        
+        Return mapping tx hash -> receipt status (1 sukses, 0 gagal, None jika timeout)
+        """
+        statuses = {tx_hash: None for tx_hash in tx_hashes}
+        pending = list(statuses)
+        deadline = time.monotonic() + timeout
+        
+        while pending:
+            try:
+                receipts = await self._rpc_batch(
+                    [('eth_getTransactionReceipt', [tx_hash]) for tx_hash in pending]
+                )
+            except Exception as e:
+                self.logger.warning("Error polling receipts: %s", e)
+                receipts = [None] * len(pending)
             
+            still_pending = []
+            for tx_hash, receipt in zip(pending, receipts):
+                if receipt is None:
+                    still_pending.append(tx_hash)
+                else:
+                    statuses[tx_hash] = int(receipt['status'], 16)
+            pending = still_pending
+            
+            if pending:
+                if time.monotonic() >= deadline:
+                    self.logger.error("⏳ %s transactions not confirmed within %ss", len(pending), timeout)
+                    break
+                await asyncio.sleep(interval)
+        
+        return statuses
+    
+    async def execute_stake_operation(self, wallet: Dict, stake_amount: float) -> Optional[str]:
+        """Execute staking operation"""
+        tx_hash = await self.submit_stake_operation(wallet, stake_amount)
+        if not tx_hash:
+            return None
+        
+        statuses = await self.await_receipts([tx_hash])
+        if statuses[tx_hash] == 1:
+            self.logger.info("✅ Staked %s HLS from %s - TX: %s", stake_amount, wallet['id'], tx_hash)
+            return tx_hash
+        else:
+            self.logger.error("❌ Stake transaction failed for %s - TX: %s", wallet['id'], tx_hash)
+            return None
+    
+    async def execute_auto_compound(self, wallet: Dict) -> Optional[str]:
+        """Execute auto compound rewards"""
+        tx_hash = await self.submit_auto_compound(wallet)
+        if not tx_hash:
+            return None
+        
+        statuses = await self.await_receipts([tx_hash])
+        if statuses[tx_hash] == 1:
+            self.logger.info("✅ Compounded rewards for %s - TX: %s", wallet['id'], tx_hash)
+            return tx_hash
+        else:
+            self.logger.error("❌ Compound failed for %s - TX: %s", wallet['id'], tx_hash)
+            return None
+    
+    async def get_pending_rewards(self, address: str) -> float:
+        """Get pending staking rewards"""
+        try:
+            # Placeholder - implement sesuai dengan Helios staking contract
+            # Contoh: call contract method untuk get pending rewards
+            return 0.0
         except Exception as e:
-            self.logger.error(f"Bridge error for {wallet['id']}: {e}")
+            self.logger.error("Error getting rewards for %s: %s", address, e)
+            return 0.0
+    
+    async def execute_bridge_operation(self, wallet: Dict, amount: float, target_chain: str) -> Optional[str]:
+        """Execute bridge operation ke chain lain"""
+        tx_hash = await self.submit_bridge_operation(wallet, amount, target_chain)
+        if not tx_hash:
+            return None
+        
+        statuses = await self.await_receipts([tx_hash])
+        if statuses[tx_hash] == 1:
+            self.logger.info("✅ Bridged %s HLS from %s to %s - TX: %s", amount, wallet['id'], target_chain, tx_hash)
+            return tx_hash
+        else:
+            self.logger.error("❌ Bridge failed for %s - TX: %s", wallet['id'], tx_hash)
             return None
     
     async def get_wallet_info(self, address: str) -> Dict:
@@ -177,7 +464,7 @@ class HeliosOperations:
                 'total_value': balance + pending_rewards
             }
         except Exception as e:
-            self.logger.error(f"Error getting wallet info for {address}: {e}")
+            self.logger.error("Error getting wallet info for %s: %s", address, e)
             return {
                 'address': address,
                 'balance': 0.0,
@@ -1,77 +1,199 @@
 import os
 import asyncio
+import glob
+import hashlib
+import itertools
 import logging
+import logging.handlers
+import multiprocessing
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 from web3 import Web3
 from web3.middleware import geth_poa_middleware
 from eth_account import Account
 import json
 from datetime import datetime
 
+# Direktori yang sudah dibuat di process ini
+_DIRS_CREATED = set()
+
+def ensure_dir(path) -> Path:
+    """mkdir sekali per process, panggilan berikutnya tanpa syscall"""
+    path = Path(path)
+    if path not in _DIRS_CREATED:
+        path.mkdir(exist_ok=True)
+        _DIRS_CREATED.add(path)
+    return path
+
+# Di bawah jumlah ini overhead spawn process pool lebih mahal dari derivasinya
+PARALLEL_DERIVE_THRESHOLD = 64
+
+def _derive_address(private_key: str) -> Tuple[Optional[str], Optional[str]]:
+    """Derive address dari private key, return (address, error)"""
+    try:
+        return Account.from_key(private_key).address, None
+    except Exception as e:
+        return None, str(e)
+
 class WalletFileManager:
     def __init__(self, wallets_dir="wallets"):
-        self.wallets_dir = Path(wallets_dir)
-        self.wallets_dir.mkdir(exist_ok=True)
+        self.wallets_dir = ensure_dir(wallets_dir)
+        self.cache_dir = ensure_dir(self.wallets_dir / ".cache")
         self.setup_logging()
         
     def setup_logging(self):
         """Setup logging untuk GitHub Actions"""
-        log_dir = Path("logs")
-        log_dir.mkdir(exist_ok=True)
+        ensure_dir("logs")
+        
+        log_format = '%(asctime)s - %(levelname)s - %(message)s'
+        
+        # File log di-buffer, flush per 1024 records, saat ERROR, atau saat exit
+        file_handler = logging.FileHandler(f'logs/helios_bot_{datetime.now().strftime("%Y%m%d")}.log')
+        file_handler.setFormatter(logging.Formatter(log_format))
         
         logging.basicConfig(
             level=logging.INFO,
-            format='%(asctime)s - %(levelname)s - %(message)s',
+            format=log_format,
             handlers=[
-                logging.FileHandler(f'logs/helios_bot_{datetime.now().strftime("%Y%m%d")}.log'),
+                logging.handlers.MemoryHandler(
+                    capacity=1024,
+                    target=file_handler,
+                    flushLevel=logging.ERROR
+                ),
                 logging.StreamHandler()
             ]
         )
         self.logger = logging.getLogger(__name__)
     
-    def load_wallets_from_txt(self, filename: str) -> List[Dict]:
-        """Load private keys dari file .txt"""
+    def read_wallet_file(self, filename: str) -> Optional[Dict]:
+        """Parse file .txt menjadi private keys + cached addresses (tanpa derivasi)"""
         file_path = self.wallets_dir / filename
-        wallets = []
         
         if not file_path.exists():
-            self.logger.error(f"Wallet file not found: {file_path}")
-            return []
+            self.logger.error("Wallet file not found: %s", file_path)
+            return None
         
         try:
-            with open(file_path, 'r') as f:
-                lines = f.readlines()
-                
-            for i, line in enumerate(lines):
-                line = line.strip()
-                if line and not line.startswith('#'):  # Skip comments and empty lines
-                    try:
-                        # Validate private key
-                        if line.startswith('0x'):
-                            private_key = line
-                        else:
-                            private_key = '0x' + line
-                            
-                        account = Account.from_key(private_key)
-                        wallet_config = {
-                            'id': f"{filename.replace('.txt', '')}_{i+1}",
-                            'private_key': private_key,
-                            'address': account.address,
-                            'filename': filename,
-                            'line_number': i+1
-                        }
-                        wallets.append(wallet_config)
-                        
-                    except Exception as e:
-                        self.logger.error(f"Invalid private key at line {i+1} in {filename}: {e}")
-                        
-            self.logger.info(f"Loaded {len(wallets)} valid wallets from {filename}")
-            return wallets
-            
+            with open(file_path, 'rb') as f:
+                raw = f.read()
         except Exception as e:
-            self.logger.error(f"Error reading wallet file {filename}: {e}")
+            self.logger.error("Error reading wallet file %s: %s", filename, e)
+            return None
+        
+        keys = []
+        for i, bline in enumerate(raw.splitlines()):
+            bline = bline.strip()
+            if not bline or bline[:1] == b'#':  # Skip comments and empty lines
+                continue
+            
+            try:
+                line = bline.decode('ascii')  # Private keys selalu hex ASCII
+            except UnicodeDecodeError as e:
+                self.logger.error("Invalid private key at line %s in %s: %s", i+1, filename, e)
+                continue
+            
+            private_key = line if line.startswith('0x') else '0x' + line
+            keys.append((i+1, private_key))
+        
+        # Address hasil derivasi di-cache berdasarkan nama + hash isi file
+        cache_file = self.cache_dir / f"{filename}.{hashlib.sha256(raw).hexdigest()}.json"
+        
+        return {
+            'filename': filename,
+            'keys': keys,
+            'cache_file': cache_file,
+            'cached_addresses': self.load_address_cache(cache_file)
+        }
+    
+    def build_wallets(self, parsed: Dict, derived: Dict[int, Tuple[Optional[str], Optional[str]]]) -> List[Dict]:
+        """Gabungkan private keys dengan addresses (cached atau hasil derivasi)"""
+        filename = parsed['filename']
+        cached_addresses = parsed['cached_addresses'] or {}
+        wallets = []
+        
+        for line_number, private_key in parsed['keys']:
+            address = cached_addresses.get(line_number)
+            if address is None:
+                address, error = derived[line_number]
+                if address is None:
+                    self.logger.error("Invalid private key at line %s in %s: %s", line_number, filename, error)
+                    continue
+            
+            wallets.append({
+                'id': f"{filename.replace('.txt', '')}_{line_number}",
+                'private_key': private_key,
+                'address': address,
+                'filename': filename,
+                'line_number': line_number
+            })
+        
+        if parsed['cached_addresses'] is None:
+            self.save_address_cache(parsed['cache_file'], wallets)
+        
+        self.logger.info("Loaded %s valid wallets from %s", len(wallets), filename)
+        return wallets
+    
+    def uncached_keys(self, parsed: Dict) -> List[Tuple[int, str]]:
+        """Private keys yang address-nya belum ada di cache"""
+        cached_addresses = parsed['cached_addresses'] or {}
+        return [
+            (line_number, private_key)
+            for line_number, private_key in parsed['keys']
+            if line_number not in cached_addresses
+        ]
+    
+    def load_wallets_from_txt(self, filename: str) -> List[Dict]:
+        """Load private keys dari file .txt"""
+        parsed = self.read_wallet_file(filename)
+        if parsed is None:
             return []
+        
+        derived = {
+            line_number: _derive_address(private_key)
+            for line_number, private_key in self.uncached_keys(parsed)
+        }
+        return self.build_wallets(parsed, derived)
+    
+    def load_address_cache(self, cache_file: Path) -> Optional[Dict[int, str]]:
+        """Load cached addresses (line_number -> address), None jika belum ada"""
+        if not cache_file.exists():
+            return None
+        
+        try:
+            with open(cache_file, 'r') as f:
+                entries = json.load(f)
+            return {entry['line_number']: entry['address'] for entry in entries}
+        except Exception as e:
+            self.logger.warning("Ignoring unreadable address cache %s: %s", cache_file.name, e)
+            return None
+    
+    def save_address_cache(self, cache_file: Path, wallets: List[Dict]):
+        """Simpan addresses secara atomic (tanpa private keys)"""
+        entries = [
+            {'id': w['id'], 'address': w['address'], 'line_number': w['line_number']}
+            for w in wallets
+        ]
+        
+        tmp_path = None
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+            with os.fdopen(fd, 'w') as f:
+                json.dump(entries, f)
+            os.replace(tmp_path, cache_file)
+        except Exception as e:
+            self.logger.warning("Failed to write address cache %s: %s", cache_file.name, e)
+            if tmp_path is not None:
+                Path(tmp_path).unlink(missing_ok=True)
+            return
+        
+        # Hapus cache lama dari versi file yang sama; cek nama persis supaya
+        # cache "a.txt.old.txt.<sha>.json" tidak ikut terhapus oleh "a.txt"
+        filename = cache_file.name.rsplit('.', 2)[0]
+        for stale_file in self.cache_dir.glob(f"{glob.escape(filename)}.*.json"):
+            if stale_file != cache_file and stale_file.name.rsplit('.', 2)[0] == filename:
+                stale_file.unlink(missing_ok=True)
     
     def load_all_wallet_files(self) -> Dict[str, List[Dict]]:
         """Load semua file .txt dalam folder wallets"""
@@ -79,32 +201,53 @@ class WalletFileManager:
         
         txt_files = list(self.wallets_dir.glob("*.txt"))
         if not txt_files:
-            self.logger.warning(f"No .txt files found in {self.wallets_dir}")
+            self.logger.warning("No .txt files found in %s", self.wallets_dir)
             return {}
         
-        for txt_file in txt_files:
-            filename = txt_file.name
-            wallets = self.load_wallets_from_txt(filename)
+        parsed_files = [self.read_wallet_file(txt_file.name) for txt_file in txt_files]
+        parsed_files = [parsed for parsed in parsed_files if parsed is not None]
+        
+        # Kumpulkan semua key yang belum di-cache, derive sekaligus
+        pending = [
+            (parsed['filename'], line_number, private_key)
+            for parsed in parsed_files
+            for line_number, private_key in self.uncached_keys(parsed)
+        ]
+        keys = [private_key for _, _, private_key in pending]
+        
+        if len(keys) >= PARALLEL_DERIVE_THRESHOLD:
+            # secp256k1 derivation CPU-bound, pakai semua core. Loader jalan di
+            # worker thread (run_batch), jadi jangan fork process yang multi-threaded
+            with ProcessPoolExecutor(mp_context=multiprocessing.get_context("forkserver")) as executor:
+                results = list(executor.map(_derive_address, keys, chunksize=32))
+        else:
+            results = [_derive_address(private_key) for private_key in keys]
+        
+        derived = {}
+        for (filename, line_number, _), result in zip(pending, results):
+            derived.setdefault(filename, {})[line_number] = result
+        
+        for parsed in parsed_files:
+            filename = parsed['filename']
+            wallets = self.build_wallets(parsed, derived.get(filename, {}))
             if wallets:
                 all_wallets[filename] = wallets
                 
         total_wallets = sum(len(wallets) for wallets in all_wallets.values())
-        self.logger.info(f"Total loaded: {total_wallets} wallets from {len(all_wallets)} files")
+        self.logger.info("Total loaded: %s wallets from %s files", total_wallets, len(all_wallets))
         
         return all_wallets
     
     def split_wallets_into_batches(self, all_wallets: Dict, batch_size: int = 50) -> List[List[Dict]]:
         """Split wallets menjadi batches untuk parallel processing"""
-        flat_wallets = []
-        for filename, wallets in all_wallets.items():
-            flat_wallets.extend(wallets)
+        flat_wallets = list(itertools.chain.from_iterable(all_wallets.values()))
         
         batches = []
         for i in range(0, len(flat_wallets), batch_size):
             batch = flat_wallets[i:i + batch_size]
             batches.append(batch)
             
-        self.logger.info(f"Split {len(flat_wallets)} wallets into {len(batches)} batches")
+        self.logger.info("Split %s wallets into %s batches", len(flat_wallets), len(batches))
         return batches
     
     def create_sample_wallet_files(self):
@@ -128,4 +271,4 @@ class WalletFileManager:
             if not file_path.exists():
                 with open(file_path, 'w') as f:
                     f.write('\n'.join(content))
-                self.logger.info(f"Created sample file: {filename}")
+                self.logger.info("Created sample file: %s", filename)